@@ -5,41 +5,69 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.enums import TA_JUSTIFY
 from reportlab.lib import colors
 import os
-import glob
 import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from xml.sax.saxutils import escape as _xml_escape
 
 # --- Configuration ---
 INPUT_FOLDER = "raw_pdfs"
 OUTPUT_FOLDER = "clean_pdfs"
+# Written next to the Clean_ output when a PDF has no content left after
+# cleaning (all pages junk or blank), so reruns count it as up to date
+EMPTY_MARKER_SUFFIX = ".empty"
+
+# Checked against the page text lowercased once in is_junk_page()
+_JUNK_TRIGGERS = ("creative commons", "isbn 978", "suggested citation", "mailing address:", "all rights reserved")
+
+# --- Precompiled Patterns ---
+_PAT_PAGE_MARK = re.compile(r'---\s*PAGE\s*\d+\s*---')
+_PAT_SOURCE = re.compile(r'^(Source|Figure|http).*', re.IGNORECASE)
+_PAT_COLSEP3 = re.compile(r'\s{3,}')
+_PAT_TABLE_GROUP = re.compile(r'(<TABLE_ROW>.*?)(?=\s*<FORCE_BREAK>|\s*[A-Z])')
+# Header 1 | Header 2 | numbered list item, decided by one anchored match
+_PAT_STRUCTURE = re.compile(
+    r'(?P<h1>\d+\.\s+[A-Z\s]+$)|(?P<h2>\d+\.\d+\.?\s+)|(?P<li>\d+(?:\.\d+)*\.?)'
+)
+
+# --- Shared Styles ---
+_STYLES = getSampleStyleSheet()
+_STYLE_BODY = ParagraphStyle(
+    'Body', parent=_STYLES['BodyText'],
+    fontSize=11, leading=15, alignment=TA_JUSTIFY, spaceAfter=10
+)
+_STYLE_H1 = ParagraphStyle(
+    'Header1', parent=_STYLES['Heading1'],
+    fontSize=14, leading=18, spaceAfter=12, textColor=colors.black,
+    fontName='Helvetica-Bold'
+)
+_STYLE_H2 = ParagraphStyle(
+    'Header2', parent=_STYLES['Heading2'],
+    fontSize=12, leading=16, spaceAfter=10, textColor=colors.black,
+    fontName='Helvetica-Bold'
+)
+_STYLE_LIST = ParagraphStyle(
+    'ListItem', parent=_STYLES['BodyText'],
+    fontSize=11, leading=15, leftIndent=20, spaceAfter=8,
+    fontName='Helvetica' 
+)
 
 class RAGSanitizer:
     def __init__(self, input_path, output_path):
         self.input_path = input_path
         self.output_path = output_path
-        self.doc = fitz.open(input_path)
         self.story = []
-        self.styles = getSampleStyleSheet()
+        self.skipped_pages = []
+        self.wrote_output = False
+        self.styles = _STYLES
         
         # --- Styles ---
-        self.style_body = ParagraphStyle(
-            'Body', parent=self.styles['BodyText'],
-            fontSize=11, leading=15, alignment=TA_JUSTIFY, spaceAfter=10
-        )
-        self.style_h1 = ParagraphStyle(
-            'Header1', parent=self.styles['Heading1'],
-            fontSize=14, leading=18, spaceAfter=12, textColor=colors.black,
-            fontName='Helvetica-Bold'
-        )
-        self.style_h2 = ParagraphStyle(
-            'Header2', parent=self.styles['Heading2'],
-            fontSize=12, leading=16, spaceAfter=10, textColor=colors.black,
-            fontName='Helvetica-Bold'
-        )
-        self.style_list = ParagraphStyle(
-            'ListItem', parent=self.styles['BodyText'],
-            fontSize=11, leading=15, leftIndent=20, spaceAfter=8,
-            fontName='Helvetica' 
-        )
+        self.style_body = _STYLE_BODY
+        self.style_h1 = _STYLE_H1
+        self.style_h2 = _STYLE_H2
+        self.style_list = _STYLE_LIST
+        # _PAT_STRUCTURE group name -> style
+        self.structure_styles = {'h1': self.style_h1, 'h2': self.style_h2, 'li': self.style_list}
 
     def is_junk_page(self, text):
         """Skip TOC, Index, and License pages."""
@@ -48,43 +76,42 @@ class RAGSanitizer:
         if "contents" in text_lower[:200] and "chapter" in text_lower: return True
         if "list of tables" in text_lower or "list of figures" in text_lower: return True
         
-        junk_triggers = ["creative commons", "isbn 978", "suggested citation", "mailing address:", "all rights reserved"]
-        if sum(1 for t in junk_triggers if t in text_lower) >= 2: return True 
+        # Two or more license/imprint triggers mark a legal page
+        if sum(1 for t in _JUNK_TRIGGERS if t in text_lower) >= 2: return True 
         return False
 
     def clean_text_rag_optimized(self, text):
         """Removes watermarks, headers, and specific junk."""
-        text = re.sub(r'\\', '', text)
-        text = re.sub(r'---\s*PAGE\s*\d+\s*---', '', text)
-        text = text.replace('©', '').replace('\xa0', ' ').replace('\\', '').replace('AKW', '')
+        text = text.replace('\\', '')
+        text = _PAT_PAGE_MARK.sub('', text)
+        text = text.replace('©', '').replace('\xa0', ' ').replace('AKW', '')
         
         lines = text.split('\n')
         cleaned_lines = []
-        hit_footer = False
+        append = cleaned_lines.append
 
         for line in lines:
             stripped = line.strip()
             if len(stripped) < 3: continue
             
-            # Junk Filters
-            if "We want to hear from you" in stripped: hit_footer = True
-            if hit_footer: continue 
+            # Junk Filters (everything after the feedback footer is dropped)
+            if "We want to hear from you" in stripped: break
             if "FAO" in stripped and "Yangon" in stripped: continue
             if "Page" in stripped and "of" in stripped: continue
             if "Tuesday, December" in stripped: continue
             if "CD1098EN" in stripped: continue
-            if re.match(r'^(Source|Figure|http).*', stripped, re.IGNORECASE): continue
+            if _PAT_SOURCE.match(stripped): continue
 
             # --- STRUCTURE MARKERS ---
             # 1. Detect Tables: Look for 2+ spaces between words (Column Gaps)
             # We explicitly mark lines that look like table rows with <TABLE_ROW>
-            if len(re.split(r'\s{3,}', stripped)) > 1: 
-                cleaned_lines.append("<TABLE_ROW>" + stripped)
-            # 2. Detect Lists/Headers
-            elif re.match(r'^\d+(\.\d+)*\.?', stripped):
-                cleaned_lines.append("<FORCE_BREAK>" + stripped)
+            if _PAT_COLSEP3.search(stripped): 
+                append("<TABLE_ROW>" + stripped)
+            # 2. Detect Lists/Headers (any line starting with a digit)
+            elif stripped[0].isdecimal():
+                append("<FORCE_BREAK>" + stripped)
             else:
-                cleaned_lines.append(stripped)
+                append(stripped)
             
         return "\n".join(cleaned_lines)
 
@@ -93,7 +120,7 @@ class RAGSanitizer:
         data = []
         for line in table_lines:
             # Split by 3+ spaces to find columns
-            cols = re.split(r'\s{3,}', line.strip())
+            cols = _PAT_COLSEP3.split(line.strip())
             data.append(cols)
         
         if not data: return None
@@ -110,74 +137,78 @@ class RAGSanitizer:
         return t
 
     def sanitize(self):
-        for page_num in range(len(self.doc)):
-            page = self.doc.load_page(page_num)
-            raw_text = page.get_text("text") 
+        story_append = self.story.append
+        structure_styles = self.structure_styles
+
+        # Close the MuPDF document before ReportLab layout starts
+        with fitz.open(self.input_path) as doc:
+            for page in doc:
+                raw_text = page.get_text("text") 
+
+                # Blank or image-only page: no line could survive cleaning
+                if len(raw_text) < 3 or raw_text.isspace(): continue
             
-            if self.is_junk_page(raw_text):
-                print(f"   [Skipping Junk Page {page_num+1}]")
-                continue
+                if self.is_junk_page(raw_text):
+                    self.skipped_pages.append(page.number + 1)
+                    continue
 
-            clean_text = self.clean_text_rag_optimized(raw_text)
+                clean_text = self.clean_text_rag_optimized(raw_text)
             
-            # Process Paragraphs & Tables
-            clean_text = clean_text.replace('\n', ' ') 
-            clean_text = clean_text.replace('<FORCE_BREAK>', '\n<FORCE_BREAK>')
-            # Group Table Rows together
-            clean_text = re.sub(r'(<TABLE_ROW>.*?)(?=\s*<FORCE_BREAK>|\s*[A-Z])', r'\n<TABLE_BLOCK>\1', clean_text)
+                # Process Paragraphs & Tables
+                clean_text = clean_text.replace('\n', ' ') 
+                clean_text = clean_text.replace('<FORCE_BREAK>', '\n<FORCE_BREAK>')
+                # Group Table Rows together (most pages have none)
+                if '<TABLE_ROW>' in clean_text:
+                    clean_text = _PAT_TABLE_GROUP.sub(r'\n<TABLE_BLOCK>\1', clean_text)
             
-            blocks = clean_text.split('\n')
+                blocks = clean_text.split('\n')
 
-            table_buffer = []
+                table_buffer = []
 
-            for block in blocks:
-                block = block.strip()
-                if not block: continue
+                for block in blocks:
+                    block = block.strip()
+                    if not block: continue
                 
-                # --- TABLE HANDLING ---
-                if "<TABLE_ROW>" in block or "<TABLE_BLOCK>" in block:
-                    # Clean tags
-                    row_content = block.replace('<TABLE_BLOCK>', '').replace('<TABLE_ROW>', '').replace('<FORCE_BREAK>', '')
-                    table_buffer.append(row_content)
+                    # --- TABLE HANDLING ---
+                    if "<TABLE_ROW>" in block or "<TABLE_BLOCK>" in block:
+                        # Clean tags
+                        row_content = block.replace('<TABLE_BLOCK>', '').replace('<TABLE_ROW>', '').replace('<FORCE_BREAK>', '')
+                        table_buffer.append(row_content)
                     
-                    # If this is the last block or next is not table, flush buffer
-                    # (Simple heuristic: assumes contiguous table rows)
-                    if len(table_buffer) > 1: 
-                        # Try to flush
-                        pass 
-                    continue
-                else:
-                    # Flush any existing table buffer first
-                    if table_buffer:
-                        t = self.process_table_block(table_buffer)
-                        if t: self.story.append(t)
-                        self.story.append(Spacer(1, 10))
-                        table_buffer = []
-
-                # --- TEXT HANDLING ---
-                text_content = block.replace('<FORCE_BREAK>', '').strip()
-                if not text_content: continue
-
-                # Header Logic
-                if re.match(r'^\d+\.\s+[A-Z\s]+$', text_content) and len(text_content) < 80:
-                    style = self.style_h1
-                elif re.match(r'^\d+\.\d+\.?\s+', text_content) and len(text_content) < 80:
-                    style = self.style_h2
-                elif re.match(r'^\d+(\.\d+)*\.?', text_content):
-                    style = self.style_list
-                else:
-                    style = self.style_body
-
-                try:
-                    p = Paragraph(text_content, style)
-                    self.story.append(p)
-                except:
-                    pass
+                        # If this is the last block or next is not table, flush buffer
+                        # (Simple heuristic: assumes contiguous table rows)
+                        if len(table_buffer) > 1: 
+                            # Try to flush
+                            pass 
+                        continue
+                    else:
+                        # Flush any existing table buffer first
+                        if table_buffer:
+                            t = self.process_table_block(table_buffer)
+                            if t: story_append(t)
+                            story_append(Spacer(1, 10))
+                            table_buffer = []
+
+                    # --- TEXT HANDLING ---
+                    text_content = block.replace('<FORCE_BREAK>', '').strip()
+                    if not text_content: continue
+
+                    # Header Logic (over-long headers fall back to list items)
+                    m = _PAT_STRUCTURE.match(text_content)
+                    if m is None:
+                        style = self.style_body
+                    elif len(text_content) < 80:
+                        style = structure_styles[m.lastgroup]
+                    else:
+                        style = self.style_list
+
+                    # Extracted text is plain text, not Paragraph markup
+                    story_append(Paragraph(_xml_escape(text_content), style))
             
-            # Flush table at end of page if any
-            if table_buffer:
-                t = self.process_table_block(table_buffer)
-                if t: self.story.append(t)
+                # Flush table at end of page if any
+                if table_buffer:
+                    t = self.process_table_block(table_buffer)
+                    if t: story_append(t)
 
         if self.story:
             doc = SimpleDocTemplate(
@@ -185,24 +216,55 @@ class RAGSanitizer:
                 rightMargin=50, leftMargin=50, topMargin=50, bottomMargin=50
             )
             doc.build(self.story)
+            self.wrote_output = True
+        return self.skipped_pages
 
 # --- Batch Runner ---
-def run_batch():
+def _process_one(path_pair):
+    """Sanitizes one PDF in a worker process; returns a status line."""
+    in_path, out_path = path_pair
+    name = os.path.basename(in_path)
+    try:
+        s = RAGSanitizer(in_path, out_path)
+        skipped = s.sanitize()
+        note = f" [Skipped Junk Pages {', '.join(map(str, skipped))}]" if skipped else ""
+        marker = out_path + EMPTY_MARKER_SUFFIX
+        if not s.wrote_output:
+            # Drop any output left over from an earlier run with content
+            if os.path.exists(out_path): os.remove(out_path)
+            open(marker, "w").close()
+            return f"   - {name}... ⚠️ No content left after cleaning{note}"
+        if os.path.exists(marker): os.remove(marker)
+        return f"   - {name}... ✅ Done{note}"
+    except Exception as e:
+        return f"   - {name}... ❌ Error: {e}"
+
+def _is_up_to_date(in_path, out_path):
+    """True if the output (or its empty-result marker) is newer than the source."""
+    src_mtime = os.path.getmtime(in_path)
+    for path in (out_path, out_path + EMPTY_MARKER_SUFFIX):
+        if os.path.exists(path) and os.path.getmtime(path) >= src_mtime: return True
+    return False
+
+def run_batch(force=False):
+    """Cleans every PDF in INPUT_FOLDER; force=True also rebuilds up-to-date outputs."""
     if not os.path.exists(OUTPUT_FOLDER): os.makedirs(OUTPUT_FOLDER)
-    files = glob.glob(os.path.join(INPUT_FOLDER, "*.pdf"))
-    
-    print(f"🚀 Cleaning {len(files)} PDFs (Smart Table Mode)...")
+    with os.scandir(INPUT_FOLDER) as it:
+        files = [e.path for e in it if e.is_file() and e.name.lower().endswith('.pdf')]
     
+    # Skip PDFs whose cleaned output is already newer than the source
+    pairs = []
     for f in files:
-        name = os.path.basename(f)
-        out_name = os.path.join(OUTPUT_FOLDER, "Clean_" + name)
-        try:
-            print(f"   - {name}...", end=" ")
-            s = RAGSanitizer(f, out_name)
-            s.sanitize()
-            print("✅ Done")
-        except Exception as e:
-            print(f"❌ Error: {e}")
+        out_name = os.path.join(OUTPUT_FOLDER, "Clean_" + os.path.basename(f))
+        if not force and _is_up_to_date(f, out_name): continue
+        pairs.append((f, out_name))
+    
+    print(f"🚀 Cleaning {len(pairs)} PDFs (Smart Table Mode, {len(files) - len(pairs)} up to date)...")
+    
+    with ProcessPoolExecutor(max_workers=min(os.cpu_count() or 1, 4)) as executor:
+        for status in executor.map(_process_one, pairs, chunksize=1):
+            print(status)
 
 if __name__ == "__main__":
-    run_batch()
\ No newline at end of file
+    # --force: rebuild everything, e.g. after changing the cleaning rules
+    run_batch(force="--force" in sys.argv[1:])
\ No newline at end of file